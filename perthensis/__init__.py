@@ -1,23 +1,22 @@
 __all__ = []
 
-# Try to import the important classes from our submodules.
-for module, classes in [
-            ('debounce', ['DebouncedRotary', 'TimerDebounce']),
-            ('heartbeat', ['Heartbeat']),
-            ('scheduler', ['Scheduler']),
-        ]:
-    try:
-        imported = __import__('perthensis.{0}'.format(module),
-                              globals(), locals(), classes)
-        __all__.extend(classes)
-        for cls in classes:
-            globals()[cls] = getattr(imported, cls)
-        del imported, cls
-    except ImportError:
-        # This error can also originate from _inside_ the module, but
-        # in any case, it can't be used. Nevertheless, we _could_ try to
-        # re-raise the error here...?
-        pass
+# Try to import the important classes from our submodules. An ImportError can
+# also originate from _inside_ the module, but in any case, it can't be used.
+# Nevertheless, we _could_ try to re-raise the error here...?
+try:
+    from .debounce import DebouncedRotary, TimerDebounce
+    __all__.extend(('DebouncedRotary', 'TimerDebounce'))
+except ImportError:
+    pass
 
-# Keep the namespace clear.
-del module, classes
+try:
+    from .heartbeat import Heartbeat
+    __all__.append('Heartbeat')
+except ImportError:
+    pass
+
+try:
+    from .scheduler import Scheduler
+    __all__.append('Scheduler')
+except ImportError:
+    pass
@@ -1,12 +1,21 @@
-from machine import disable_irq, enable_irq, Pin, Timer
-from micropython import schedule
+from array import array
+from machine import Pin, Timer
+from micropython import const, schedule
+from utime import ticks_add, ticks_diff, ticks_ms, ticks_us
+
+
+# Bit n is set if the 4-bit rotary state n (previous CLK/DATA values in bits
+# 2-3, current ones in bits 0-1) is a valid Gray code transition.
+_VALID_TRANSITIONS = const(0x6996)
+# Marks a pin as not being debounced in ``TimerDebounce._deadlines``. Valid
+# ``ticks_ms()`` values are never negative.
+_IDLE = const(-1)
+# Marks a pin as not having settled yet in ``TimerDebounce._previous``.
+_UNKNOWN = const(0xff)
 
 
 class TimerDebounce:
     """Debounce pins using change and timer interrupts."""
-    RUNNING_NONE = 0
-    RUNNING_SOME = 1
-    RUNNING_CHECKING = 2
 
     def __init__(self, timer_id):
         """Create a new debouncer for one or more pins.
@@ -16,62 +25,119 @@ class TimerDebounce:
                 be a valid and unused timer ID.
         """
         self._timer = Timer(timer_id)
-        self._pins = {}
         self._timer_handler_bound = self._timer_handler
 
-        # This keeps track of whether there are some debouncing jobs (and thus
-        # the interval timer) running or not. 2-state logic would probably be
-        # sufficient, but 3-state logic makes the loop in ``settle_checker``
-        # work even if a new job is added while it's running.
-        self._running_jobs = self.RUNNING_NONE
+        # The ``DebouncedPin`` and ``DebouncedPort`` instances.
+        self._pins = []
 
-    def _change_handler(self, pin):
-        """Scheduled(!) every time a pin's state changes."""
-        irq = disable_irq()
-        try:
-            # Start the timer interrupt, if it's not already running.
-            if self._running_jobs == self.RUNNING_NONE:
-                self._timer.init(period=1, mode=Timer.PERIODIC,
-                                 callback=self._timer_handler_bound)
-            # Whatever this was before, now there's at least one running.
-            self._running_jobs = self.RUNNING_SOME
-        finally:
-            enable_irq(irq)
+        # The state of all pins is kept in parallel arrays, indexed by the
+        # slot the pin has been assigned in ``_add_slot``. This keeps the
+        # loops below free of attribute lookups, and the interrupt handlers
+        # can write to the preallocated slots without allocating.
+        self._ids = []
+        self._callbacks = []
+        # The ``ticks_ms()`` value at which a pin will be considered settled,
+        # or ``_IDLE`` if it's not being debounced right now.
+        self._deadlines = array('i')
+        self._values = bytearray()
+        self._previous = bytearray()
+
+        # The number of pins that are currently settling. Incremented by the
+        # pin interrupt handlers, decremented by the settle checker. Once it's
+        # zero, there's nothing left to scan.
+        self._active = 0
+
+        # The ``ticks_ms()`` value the one-shot timer is currently armed for,
+        # or None if the timer is not running. The timer is only ever armed
+        # for the earliest settle deadline of all pins, so there is no work
+        # at all between two debounce events.
+        self._next_deadline = None
+
+    def _arm_timer(self, deadline):
+        """Program the one-shot timer to fire at ``deadline``."""
+        self._next_deadline = deadline
+        self._timer.init(period=max(1, ticks_diff(deadline, ticks_ms())),
+                         mode=Timer.ONE_SHOT,
+                         callback=self._timer_handler_bound)
+
+    def _change_handler(self, deadline):
+        """Called by the pin interrupt handlers when a pin starts settling.
+
+        The pin interrupts are registered as soft (i.e. scheduled) ones, which
+        is ``Pin.irq()``'s default, so they can't interrupt the settle checker
+        and it's safe to touch the timer directly instead of scheduling this.
+        """
+        # Only reprogram the timer if this is the new earliest deadline.
+        # Otherwise, the settle checker will re-arm it when it runs.
+        if self._next_deadline is None \
+                or ticks_diff(deadline, self._next_deadline) < 0:
+            self._arm_timer(deadline)
 
     def _timer_handler(self, timer):
         """This is the callback of the settle timer interrupt."""
-        schedule(self._settle_checker, None)
+        try:
+            schedule(self._settle_checker, None)
+        except RuntimeError:
+            # Probably "schedule queue full". The timer is a one-shot one, so
+            # if we'd just ignore this, nobody would ever re-arm it. Try again
+            # in a millisecond instead.
+            timer.init(period=1, mode=Timer.ONE_SHOT,
+                       callback=self._timer_handler_bound)
 
     def _settle_checker(self, _):
-        """Scheduled(!) each ms while we're debouncing something."""
-        self._running_jobs = self.RUNNING_CHECKING
-        # Most of the following code could possibly be moved into the
-        # ``DebouncedTimer`` class for separation of concerns, but we should
-        # probably do some benchmarking first.
-        for pin_id, pin in self._pins.items():
-            if pin._settle_wait is not None:  # pin is being debounced
-                if pin._settle_wait <= 0:     # it has settled now
-                    pin._settle_wait = None
-                    if pin._value != pin._previous:
-                        pin._previous = pin._value
-                        pin._callback(pin_id, pin._value)
-                else:
-                    # Since no interrupt sets this to None, we can safely
-                    # assume that it's an int.
-                    pin._settle_wait -= 1
-                    # There is at least one running job left.
-                    self._running_jobs = self.RUNNING_SOME
-
-        # If there are no debouncing jobs left, disable the timer.
-        irq = disable_irq()
+        """Scheduled(!) each time the earliest settle deadline has passed."""
+        # The one-shot timer has expired.
+        self._next_deadline = None
+        if not self._active:
+            return
+        deadlines = self._deadlines
+        values = self._values
+        previous = self._previous
+        callbacks = self._callbacks
+        ids = self._ids
+        now = ticks_ms()
+        next_deadline = None
+        scanned = False
         try:
-            if self._running_jobs == self.RUNNING_CHECKING:
-                # Didn't see running jobs, and no new ones were inserted
-                # meanwhile via an interrupt.
-                self._running_jobs = self.RUNNING_NONE
-                self._timer.deinit()
+            for i in range(len(deadlines)):
+                deadline = deadlines[i]
+                if deadline == _IDLE:  # pin is not being debounced
+                    continue
+                if ticks_diff(deadline, now) > 0:  # pin is still settling
+                    if next_deadline is None \
+                            or ticks_diff(deadline, next_deadline) < 0:
+                        next_deadline = deadline
+                    continue
+                # The pin has settled.
+                deadlines[i] = _IDLE
+                self._active -= 1
+                value = values[i]
+                if value != previous[i]:
+                    previous[i] = value
+                    callbacks[i](ids[i], value)
+                    # The callback might have taken a while. Pins that have
+                    # settled in the meantime can be handled in this run,
+                    # instead of arming the timer for a deadline that has
+                    # already passed.
+                    now = ticks_ms()
+                if not self._active:
+                    # No other pin is settling, skip the rest. Pins that start
+                    # settling after this will arm the timer in
+                    # ``_change_handler`` themselves.
+                    break
+            scanned = True
         finally:
-            enable_irq(irq)
+            # If a callback raised an exception, the remaining pins haven't
+            # been looked at. Don't leave them stranded, check again soon.
+            if not scanned and self._active:
+                next_deadline = ticks_ms()
+            # Re-arm the timer for the next deadline, if there is one. The
+            # timer is only ever touched by this method and
+            # ``_change_handler``, which both run in scheduled context and can
+            # therefore not interrupt each other, so there's no need to
+            # disable interrupts.
+            if next_deadline is not None:
+                self._arm_timer(next_deadline)
 
     def add_pin(self, pin_id, callback, pull=None, threshold=20):
         """Add a new pin to be debounced.
@@ -84,11 +150,70 @@ class TimerDebounce:
                 constants.
             threshold: After how many milliseconds of having the same value
                 should the pin be considered settled?
+
+        raises:
+            IndexError: If the pin has already been added. Its argument is the
+                pin ID.
         """
-        if pin_id in self._pins:
-            raise IndexError('pin {0} already present'.format(pin_id))
-        self._pins[pin_id] = DebouncedPin(
-                self, pin_id, callback, pull, threshold)
+        if pin_id in self._ids:
+            # Pass just the ID to avoid formatting a message.
+            raise IndexError(pin_id)
+        pin = DebouncedPin(self, pin_id, pull, threshold)
+        # Only allocate the pin's slot once the pin has been configured
+        # successfully, but before its interrupt handler is enabled.
+        pin._enable(self._add_slot(pin_id, callback))
+        self._pins.append(pin)
+
+    def add_port(self, register, pins, callback, pull=None, threshold=20):
+        """Add several pins of the same GPIO port sharing one IRQ handler.
+
+        Instead of only looking at the pin that caused the interrupt, the
+        handler reads the port's input register once and updates all pins
+        that have changed. A burst of simultaneous edges (e.g. in a keyboard
+        matrix) is therefore handled in the first interrupt, and the ones
+        following it only restart the settle time of their own pin.
+
+        args:
+            register: The address of the port's input data register, e.g.
+                ``stm.GPIOA + stm.GPIO_IDR`` on stm32 or ``0xd0000004``
+                (``SIO_GPIO_IN``) on rp2.
+            pins: A dict mapping the number of each pin to its bit (0 to 31)
+                in that register.
+            callback: Like in ``add_pin``, called for each of the pins.
+            pull: Like in ``add_pin``, applies to all of the pins.
+            threshold: Like in ``add_pin``, applies to all of the pins.
+
+        raises:
+            IndexError: Like in ``add_pin``.
+            ValueError: If a bit is out of range or used more than once. Its
+                argument is the offending bit.
+        """
+        bits = list(pins.values())
+        for bit in bits:
+            # The register is read with at most 32 bits.
+            if not 0 <= bit <= 31 or bits.count(bit) > 1:
+                raise ValueError(bit)
+        # Being a dict, ``pins`` can't contain an ID twice.
+        for pin_id in pins:
+            if pin_id in self._ids:
+                raise IndexError(pin_id)
+        port = DebouncedPort(self, register, pins, pull, threshold)
+        # Only allocate the pins' slots once the port has been configured
+        # successfully, but before its interrupt handler is enabled.
+        port._enable([self._add_slot(pin_id, callback) for pin_id in pins])
+        self._pins.append(port)
+
+    def _add_slot(self, pin_id, callback):
+        """Allocate the state array slots for a new pin and return its index.
+
+        The caller is responsible for making sure the pin isn't present yet.
+        """
+        self._ids.append(pin_id)
+        self._callbacks.append(callback)
+        self._deadlines.append(_IDLE)
+        self._values.append(0)
+        self._previous.append(_UNKNOWN)
+        return len(self._ids) - 1
 
 
 class DebouncedPin:
@@ -98,30 +223,117 @@ class DebouncedPin:
     ``TimerDebounce.add_pin()`` method instead.
     """
 
-    def __init__(self, debouncer, pin_id, callback, pull, threshold_ms):
+    # MicroPython ignores ``__slots__``, so this doesn't save any memory; it
+    # merely documents the fixed set of instance attributes.
+    __slots__ = ('_debouncer', '_debounce_handler', '_deadlines', '_values',
+                 '_index', '_id', '_threshold', '_pin')
+
+    def __init__(self, debouncer, pin_id, pull, threshold_ms):
+        self._debouncer = debouncer
         self._debounce_handler = debouncer._change_handler
+        self._deadlines = debouncer._deadlines
+        self._values = debouncer._values
+        self._index = None
         self._id = pin_id
-        self._callback = callback
         self._threshold = int(threshold_ms)
-        self._settle_wait = None
-        self._previous = None
-        self._value = None
-
-        # Configure the pin and its interrupt handler.
         self._pin = Pin(pin_id, Pin.IN, pull)
+
+    def _enable(self, index):
+        """Start handling changes, using the state array slot ``index``."""
+        self._index = index
         self._pin.irq(self._irq_handler, Pin.IRQ_FALLING | Pin.IRQ_RISING)
 
     def _irq_handler(self, pin):
         """This is the pin change interrupt handler."""
-        self._settle_wait = self._threshold
-        self._value = pin.value()
-        try:
-            schedule(self._debounce_handler, self)
-        except RuntimeError:
-            # Probably "schedule queue full", but it doesn't raise a more
-            # specific exception. :( Best thing we can do is probably to just
-            # ignore it, however sad that is.
-            pass
+        i = self._index
+        deadlines = self._deadlines
+        was_settling = deadlines[i] != _IDLE
+        self._values[i] = pin.value()
+        # Every change restarts the settle time.
+        deadline = ticks_add(ticks_ms(), self._threshold)
+        deadlines[i] = deadline
+        if was_settling:
+            # The timer is already armed for an earlier deadline. The settle
+            # checker will notice that this one has been moved and re-arm the
+            # timer accordingly.
+            return
+        self._debouncer._active += 1
+        self._debounce_handler(deadline)
+
+
+class DebouncedPort:
+    """Represents a group of pins to be debounced by ``TimerDebounce``.
+
+    You should not create new instances of this class yourself; use the
+    ``TimerDebounce.add_port()`` method instead.
+    """
+
+    def __init__(self, debouncer, register, pins, pull, threshold_ms):
+        # Not every port has these, so only import them when they're needed.
+        from machine import mem16, mem32
+
+        self._debouncer = debouncer
+        self._debounce_handler = debouncer._change_handler
+        self._deadlines = debouncer._deadlines
+        self._values = debouncer._values
+        self._indexes = None
+        self._bits = bytes(pins.values())
+        self._threshold = int(threshold_ms)
+
+        self._register = register
+        self._mask = 0
+        for bit in self._bits:
+            self._mask |= 1 << bit
+        # A 16 bit read is sufficient for most ports (and the only option for
+        # the 16 bit wide input registers on stm32).
+        self._mem = mem16 if self._mask <= 0xffff else mem32
+        self._last = 0
+
+        self._pins = [Pin(pin_id, Pin.IN, pull) for pin_id in pins]
+
+    def _enable(self, indexes):
+        """Start handling changes, using the state array slots ``indexes``.
+
+        They have to be in the same order as the pins passed to ``__init__``.
+        """
+        self._indexes = array('H', indexes)
+        # Take the snapshot only now that the pins (and their pulls) have been
+        # configured, right before the interrupts go live.
+        self._last = self._mem[self._register] & self._mask
+        # All of the pins share the same interrupt handler.
+        for pin in self._pins:
+            pin.irq(self._irq_handler, Pin.IRQ_FALLING | Pin.IRQ_RISING)
+
+    def _irq_handler(self, pin):
+        """This is the shared pin change interrupt handler."""
+        word = self._mem[self._register] & self._mask
+        changed = word ^ self._last
+        self._last = word
+        # Since this is a soft interrupt, the pin that caused it might already
+        # be back at its last seen level. Like in ``DebouncedPin``, its edge
+        # should restart the settle time nevertheless.
+        trigger = self._pins.index(pin) if pin in self._pins else -1
+
+        indexes = self._indexes
+        bits = self._bits
+        deadlines = self._deadlines
+        values = self._values
+        # Every change restarts the settle time.
+        deadline = ticks_add(ticks_ms(), self._threshold)
+        started = False
+        for j in range(len(bits)):
+            bit = bits[j]
+            if j == trigger or (changed >> bit) & 1:
+                i = indexes[j]
+                values[i] = (word >> bit) & 1
+                if deadlines[i] == _IDLE:
+                    started = True
+                    self._debouncer._active += 1
+                deadlines[i] = deadline
+        if started:
+            # Pins that were already settling are taken care of by the settle
+            # checker, see ``DebouncedPin._irq_handler``.
+            self._debounce_handler(deadline)
 
 
 class DebouncedRotary:
@@ -130,11 +342,13 @@ class DebouncedRotary:
     This implementation borrows a lot from
     <https://www.best-microcontroller-projects.com/rotary-encoder.html>."""
 
-    VALID_TRANSITIONS = (False, True, True, False, True, False, False, True,
-                         True, False, False, True, False, True, True, False)
+    # See ``DebouncedPin.__slots__``.
+    __slots__ = ('_clk', '_dat', '_invert', '_cw', '_ccw', '_callback',
+                 '_state', '_min_step_us', '_last_step')
 
     def __init__(self, clk_id, data_id, callback,
-                 pull=None, fast=False, invert=False, reverse=False):
+                 pull=None, fast=False, invert=False, reverse=False,
+                 min_step_us=1500):
         """Create a new debouncer for a single rotary encoder.
 
         args:
@@ -160,13 +374,20 @@ class DebouncedRotary:
                 the encoder is being moved, set this to True.
             reverse: Set this to True to reverse how the turning direction is
                 being interpreted.
+            min_step_us: Steps detected less than this many microseconds
+                after the previous one are considered bouncing and ignored.
+                Set to 0 to disable this filter.
         """
         self._clk = Pin(clk_id, Pin.IN, pull)
         self._dat = Pin(data_id, Pin.IN, pull)
         self._invert = 0x03 if invert else 0x00
-        self._reverse = -1 if reverse else 1
+        # Precompute the values passed to the callback for both directions.
+        self._cw = -1 if reverse else 1
+        self._ccw = -self._cw
         self._callback = callback
         self._state = 0x00
+        self._min_step_us = int(min_step_us)
+        self._last_step = ticks_add(ticks_us(), -self._min_step_us)
 
         handler = self._fast_irq_handler if fast else self._stable_irq_handler
         self._clk.irq(handler, Pin.IRQ_FALLING | Pin.IRQ_RISING)
@@ -175,17 +396,29 @@ class DebouncedRotary:
     # The IRQ handlers are copy-pasted for performance.
     # If you change one, make sure to apply your changes to the other one, too.
     def _fast_irq_handler(self, pin):
-        self._state = (
+        state = (
                 (self._state << 2)  # move the previous state to the left
                 # and then add the current values
                 | (((self._dat.value() << 1) | self._clk.value())
                    ^ self._invert)  # invert both if we need to
                 ) & 0x0f  # and make sure to only keep the rightmost 4 bit
+        self._state = state
+        if state == 0x07:  # moved clockwise
+            step = self._cw
+        elif state == 0x0b:  # moved counterclockwise
+            step = self._ccw
+        else:
+            return
+        now = ticks_us()
+        # ``ticks_diff()`` is modular, so a step that comes (almost exactly)
+        # a multiple of the ``ticks_us()`` period (about 17.9 minutes on most
+        # ports) after the previous one will be dropped, too. For other
+        # long pauses, the difference is either large or negative.
+        if 0 <= ticks_diff(now, self._last_step) < self._min_step_us:
+            return  # too soon after the previous step, probably bouncing
+        self._last_step = now
         try:
-            if self._state == 0x07:  # moved clockwise
-                schedule(self._callback, self._reverse)
-            elif self._state == 0x0b:  # moved counterclockwise
-                schedule(self._callback, -1 * self._reverse)
+            schedule(self._callback, step)
         except RuntimeError:
             # Again, this might just be "schedule queue full". Ignore. :(
             pass
@@ -199,13 +432,25 @@ class DebouncedRotary:
                 | (((self._dat.value() << 1) | self._clk.value())
                    ^ self._invert)  # invert both if we need to
                 ) & 0xff  # and make sure to only keep the rightmost 8 bit
-        if self.VALID_TRANSITIONS[newstate & 0x0f]:
-            self._state = newstate
-            try:
-                if self._state == 0x87:  # moved clockwise
-                    schedule(self._callback, self._reverse)
-                elif self._state == 0x4b:  # moved counterclockwise
-                    schedule(self._callback, -1 * self._reverse)
-            except RuntimeError:
-                # Again, this might just be "schedule queue full". Ignore. :(
-                pass
+        if not (_VALID_TRANSITIONS >> (newstate & 0x0f)) & 1:
+            return
+        self._state = newstate
+        if newstate == 0x87:  # moved clockwise
+            step = self._cw
+        elif newstate == 0x4b:  # moved counterclockwise
+            step = self._ccw
+        else:
+            return
+        now = ticks_us()
+        # ``ticks_diff()`` is modular, so a step that comes (almost exactly)
+        # a multiple of the ``ticks_us()`` period (about 17.9 minutes on most
+        # ports) after the previous one will be dropped, too. For other
+        # long pauses, the difference is either large or negative.
+        if 0 <= ticks_diff(now, self._last_step) < self._min_step_us:
+            return  # too soon after the previous step, probably bouncing
+        self._last_step = now
+        try:
+            schedule(self._callback, step)
+        except RuntimeError:
+            # Again, this might just be "schedule queue full". Ignore. :(
+            pass
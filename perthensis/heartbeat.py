@@ -1,16 +1,19 @@
 """Toggle an output pin in a repeating pattern similar to a human heartbeat."""
 
 
+from array import array
 from machine import Pin, Signal
 
 
-PATTERN = [50, 100, 100, 750]
-"""A list of millisecond delay values specifying on/off times.
+PATTERN = array('H', (50, 100, 100, 750))
+"""An array of millisecond delay values specifying on/off times.
 
 Values at even indexes (0, 2, ...) specify how long the LED should be on, while
-values at odd indexes (1, 3, ...) specify how long it should be off.  The list
-could be longer or shorter than the default four items.  Also, the default list
-adds up to 1000 milliseconds on purpose, but that's not required either.
+values at odd indexes (1, 3, ...) specify how long it should be off.  The array
+could be longer or shorter than the default four items, and any other sequence
+of ints (e.g. a list) works as well.  Also, the default pattern adds up to 1000
+milliseconds on purpose, but that's not required either.  The pattern is read
+once when ``Heartbeat.beat`` starts.
 """
 
 
@@ -36,10 +39,23 @@ class Heartbeat:
         Note that it will set the pin to "on" for 2 seconds before starting the
         pattern. This is supposed to make board resets clearly visible.
         """
-        self._sig.on()
+        on = self._sig.on
+        off = self._sig.off
+        sleep_ms = sch.sleep_ms
+
+        # Group the pattern into (on, off) pairs. If it has an odd length, the
+        # last "on" is followed by an "off" of 0 ms.
+        pairs = [
+            (PATTERN[idx], PATTERN[idx + 1] if idx + 1 < len(PATTERN) else 0)
+            for idx in range(0, len(PATTERN), 2)
+        ]
+
+        on()
         await sch.sleep(2)
 
         while True:
-            for idx, delay in enumerate(PATTERN):
-                self._sig.on() if idx % 2 == 0 else self._sig.off()
-                await sch.sleep_ms(delay)
+            for on_ms, off_ms in pairs:
+                on()
+                await sleep_ms(on_ms)
+                off()
+                await sleep_ms(off_ms)
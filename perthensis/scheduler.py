@@ -13,6 +13,16 @@ except ImportError:
             'uasyncio support requires MicroPython > 1.12 (possibly nightly).'
         )
 
+# Once a Scheduler references this many tasks, the finished ones are dropped.
+# After that, this is raised to twice the number of tasks still running.
+_PRUNE_THRESHOLD = 32
+
+# Standard asyncio doesn't have sleep_ms, so we shim it.
+_sleep_ms = getattr(uasyncio, 'sleep_ms', None)
+if _sleep_ms is None:
+    def _sleep_ms(ms):
+        return uasyncio.sleep(ms * 0.001)
+
 
 class Scheduler:
     """Manage tasks running in a "cooperative multitasking" style.
@@ -23,19 +33,29 @@ class Scheduler:
 
     def __init__(self):
         self._tasks = []
+        self._prune_at = _PRUNE_THRESHOLD
+        # The event is created by ``_wait_loop``, since in older versions of
+        # standard asyncio, it would be bound to the wrong event loop if
+        # created here, outside of ``run()``.
+        self._stop_event = None
+        self._stop_requested = False
 
         # We alias some of asyncio's functions.
         self.run = uasyncio.run
         self.sleep = uasyncio.sleep
         self.wait_for = uasyncio.wait_for
+        self.sleep_ms = _sleep_ms
 
-        # Standard asyncio doesn't have sleep_ms, so we shim it.
-        self.sleep_ms = getattr(uasyncio, 'sleep_ms',
-                                lambda ms: uasyncio.sleep(ms / 1000))
-
-    async def _wait_loop(self, interval):
-        while True:
-            await self.sleep_ms(interval)
+    async def _wait_loop(self):
+        self._stop_event = uasyncio.Event()
+        try:
+            # ``stop()`` might have been called before we got here.
+            if not self._stop_requested:
+                await self._stop_event.wait()
+        finally:
+            # Allow ``run_forever()`` to be called again.
+            self._stop_event = None
+            self._stop_requested = False
 
     def create_task(self, coro, *args):
         """Launch a new task.
@@ -49,12 +69,37 @@ class Scheduler:
             The task that has been created.
         """
         task = uasyncio.create_task(coro(self, *args))
+        if len(self._tasks) >= self._prune_at:
+            self.prune()
         self._tasks.append(task)
         return task
 
+    def prune(self):
+        """Drop the references to tasks that have finished.
+
+        This is done automatically by ``create_task`` every now and then, so
+        that the memory used by finished tasks can be reclaimed.
+        """
+        self._tasks = [task for task in self._tasks if not task.done()]
+        # If lots of tasks are still running, don't scan them all again on
+        # every ``create_task`` call, but only once the list has grown again.
+        self._prune_at = max(_PRUNE_THRESHOLD, 2 * len(self._tasks))
+
     # Make it easy to call create_task().
     __call__ = create_task
 
     def run_forever(self):
-        """Give control (permanently) to the background tasks defined."""
-        self.run(self._wait_loop(10_000))
+        """Give control (permanently) to the background tasks defined.
+
+        This will only return after ``stop()`` has been called.
+        """
+        self.run(self._wait_loop())
+
+    def stop(self):
+        """Make ``run_forever()`` return.
+
+        If it's not running yet, its next call will return immediately.
+        """
+        self._stop_requested = True
+        if self._stop_event is not None:
+            self._stop_event.set()